@@ -0,0 +1,178 @@
+"""Definitions shared by the CycloneDDS benchmark publisher and subscriber.
+
+Both sides must agree exactly on the message types and the CycloneDDS
+configuration, so they live here rather than in each script.
+"""
+
+import argparse
+import os
+from dataclasses import dataclass
+
+from cyclonedds.core import Policy, Qos
+from cyclonedds.idl import IdlStruct, make_idl_struct
+from cyclonedds.idl.types import array, sequence, uint8
+
+# Size in bytes of one payload element for each --dtype
+DTYPE_SIZES = {"u8": 1, "bf16": 2, "fp32": 4}
+
+# Default Iceoryx SubQueueCapacity; CycloneDDS only delivers over shared memory
+# to readers whose KEEP_LAST history depth fits in it
+SHM_QUEUE_CAPACITY = 256
+
+# Socket buffer size requested by --tune and set as the kernel limit by --tune-kernel
+TUNED_SOCKET_BUFFER_SIZE = 10 * 1024 * 1024
+
+
+@dataclass
+class BenchmarkData(IdlStruct):
+    """DDS message type for benchmarking with variable-size byte payload.
+
+    The Python binding packs and unpacks sequence[uint8] element by element;
+    plain bytes would copy in one go but has no XTypes type object, so it
+    cannot be used as a topic member. Use --fixed-size for a single-copy path.
+    """
+    data: sequence[uint8]
+
+
+def make_fixed_size_type(size: int) -> type:
+    """Build a DDS message type whose payload is a fixed-length byte array.
+
+    Fixed-size types are "plain" in CycloneDDS, which makes them eligible for
+    loan-based (shared-memory) delivery and a single-copy serialization path.
+    """
+    return make_idl_struct("BenchmarkDataFixed", "BenchmarkDataFixed", {"data": array[uint8, size]})
+
+
+def add_common_arguments(parser: argparse.ArgumentParser, peer: str, loop: str) -> None:
+    """Add the options both scripts share; peer names the other side, loop this side's hot loop."""
+    parser.add_argument("--fixed-size", action="store_true",
+                        help=f"Use a fixed-length array[uint8, SIZE] payload type instead of sequence<uint8> (must match the {peer})")
+    parser.add_argument("--interface", type=str, default=None, help="Network interface to use for DDS traffic")
+    parser.add_argument("--tune", action="store_true",
+                        help="Use a tuned CycloneDDS config: larger socket receive buffer, higher writer "
+                             "high-watermark (WhcHigh) and 9000 B MaxMessageSize for jumbo-frame networks")
+    parser.add_argument("--tune-kernel", action="store_true",
+                        help="Raise net.core.rmem_max/wmem_max so --tune's socket buffers can be granted "
+                             "(requires root or CAP_NET_ADMIN)")
+    parser.add_argument("--shm", action="store_true",
+                        help="Use Iceoryx shared memory for same-host delivery (implies --fixed-size and caps the subscriber's "
+                             f"history depth at {SHM_QUEUE_CAPACITY}; needs iox-roudi and a CycloneDDS build with shared "
+                             "memory support)")
+    parser.add_argument("--dtype", type=str, default="u8", choices=list(DTYPE_SIZES),
+                        help="Payload element type: u8 (raw bytes), bf16 or fp32; also reports throughput in elements/s")
+    parser.add_argument("--cpu", type=int, nargs="+", default=None,
+                        help=f"Pin the {loop} loop to these CPUs; pick cores close to the NIC queue handling DDS "
+                             "traffic (see /proc/interrupts for the interface)")
+
+
+def check_common_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """Reject invalid combinations of the shared options via parser.error."""
+    if args.size % DTYPE_SIZES[args.dtype]:
+        parser.error(f"--size must be a multiple of {DTYPE_SIZES[args.dtype]} bytes for --dtype {args.dtype}")
+
+    if args.cpu and not set(args.cpu) <= os.sched_getaffinity(0):
+        parser.error(f"--cpu must be among the available CPUs {sorted(os.sched_getaffinity(0))}")
+
+
+def apply_common_arguments(args: argparse.Namespace) -> None:
+    """Apply the shared options that change system or CycloneDDS configuration.
+
+    Must run after every argument check has passed and before any DDS entity
+    is created.
+    """
+    if args.tune_kernel:
+        tune_kernel_buffers(TUNED_SOCKET_BUFFER_SIZE)
+    config = make_config(args)
+    if config:
+        os.environ["CYCLONEDDS_URI"] = config
+        print(f"CycloneDDS config: {config}")
+
+    if args.shm:
+        # Iceoryx can only carry plain (fixed-size) types
+        args.fixed_size = True
+        if not roudi_running():
+            print("Warning: iox-roudi does not appear to be running; start it before using --shm")
+
+
+def limit_history_for_shm(qos: Qos) -> Qos:
+    """Return qos with its KEEP_LAST depth capped at SHM_QUEUE_CAPACITY.
+
+    A deeper reader history makes CycloneDDS silently fall back to the network
+    path for that reader, so --shm would have no effect.
+    """
+    depth = qos[Policy.History].depth
+    if depth <= SHM_QUEUE_CAPACITY:
+        return qos
+    print(f"Capping history depth at {SHM_QUEUE_CAPACITY} (was {depth}) for shared memory delivery")
+    return qos + Qos(Policy.History.KeepLast(SHM_QUEUE_CAPACITY))
+
+
+def make_config(args: argparse.Namespace) -> str:
+    """Build a CYCLONEDDS_URI XML configuration from the command-line options.
+
+    Returns an empty string when no option requires a non-default setting.
+    """
+    domain = []
+    general = []
+    internal = []
+    if args.shm:
+        domain.append("<SharedMemory><Enable>true</Enable></SharedMemory>")
+    if args.interface:
+        general.append(f'<Interfaces><NetworkInterface name="{args.interface}"/></Interfaces>')
+    if args.tune:
+        general.append("<MaxMessageSize>9000B</MaxMessageSize>")
+        # max rather than min: CycloneDDS refuses to start if a min can't be met
+        internal.append(f'<SocketReceiveBufferSize max="{TUNED_SOCKET_BUFFER_SIZE}B"/>')
+        internal.append("<Watermarks><WhcHigh>500kB</WhcHigh></Watermarks>")
+    if not domain and not general and not internal:
+        return ""
+    return (
+        '<CycloneDDS><Domain Id="any">'
+        f"{''.join(domain)}"
+        f"<General>{''.join(general)}</General>"
+        f"<Internal>{''.join(internal)}</Internal>"
+        "</Domain></CycloneDDS>"
+    )
+
+
+def roudi_running() -> bool:
+    """Check whether the Iceoryx RouDi daemon is running on this host."""
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/comm") as f:
+                if f.read().strip() == "iox-roudi":
+                    return True
+        except OSError:
+            continue
+    return False
+
+
+def pin_to_cpus(cpus: list[int]) -> None:
+    """Pin the calling thread to the given CPUs and raise its scheduling priority.
+
+    Threads started afterwards inherit the affinity. Raising the priority needs
+    root or CAP_SYS_NICE and is skipped with a warning otherwise.
+    """
+    os.sched_setaffinity(0, cpus)
+    print(f"Pinned to CPU(s) {sorted(cpus)}")
+    try:
+        os.nice(-10)
+    except PermissionError:
+        print("Warning: could not raise scheduling priority (needs root or CAP_SYS_NICE)")
+
+
+def tune_kernel_buffers(size: int) -> None:
+    """Raise the kernel's maximum socket buffer sizes (requires root or CAP_NET_ADMIN)."""
+    for name in ("rmem_max", "wmem_max"):
+        path = f"/proc/sys/net/core/{name}"
+        try:
+            with open(path) as f:
+                if int(f.read()) >= size:
+                    continue
+            with open(path, "w") as f:
+                f.write(str(size))
+            print(f"Set net.core.{name} = {size}")
+        except OSError as e:
+            print(f"Warning: could not set net.core.{name}: {e}")
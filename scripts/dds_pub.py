@@ -2,30 +2,117 @@
 """Simple CycloneDDS publisher with throughput measurement."""
 
 import argparse
+import functools
 import os
+import struct
 import time
+from itertools import repeat, starmap
 
 # Use minimal CycloneDDS config to avoid buffer size issues
 os.environ["CYCLONEDDS_URI"] = ""
 
-from cyclonedds.core import Qos, Policy
+# Below this many nanoseconds until the next send slot, spin instead of sleeping,
+# since time.sleep() overshoots short waits by tens of microseconds
+SPIN_THRESHOLD_NS = 50_000
+
+# Discovery is asymmetric: the reader may only match the writer shortly after
+# the writer has matched it, and volatile samples sent in between are lost
+DISCOVERY_SETTLE_TIME = 0.2
+
+# Upper bound on messages written back-to-back between pacing waits
+WRITE_CHUNK = 1024
+
+from cyclonedds.core import DDSException, DDSStatus, Qos, Policy, WaitSet
 from cyclonedds.domain import DomainParticipant
 from cyclonedds.pub import DataWriter, Publisher
 from cyclonedds.topic import Topic
 from cyclonedds.idl import IdlStruct
-from cyclonedds.idl.types import sequence, uint8
-from dataclasses import dataclass
+from cyclonedds.internal import load_cyclonedds
+from cyclonedds.util import duration
+
+from dds_common import (
+    DTYPE_SIZES, BenchmarkData, add_common_arguments, apply_common_arguments, check_common_arguments,
+    make_fixed_size_type, pin_to_cpus,
+)
+
+
+def make_payload(size: int, dtype: str = "u8") -> bytes:
+    """Generate size bytes holding a repeating 256-step ramp of dtype elements."""
+    if dtype == "u8":
+        pattern = bytes(range(256))
+    else:
+        # Ramp over [0, 1) as little-endian float32
+        pattern = struct.pack("<256f", *(i / 256 for i in range(256)))
+        if dtype == "bf16":
+            # bfloat16 is the upper (most significant) half of a float32
+            pattern = b"".join(pattern[i + 2:i + 4] for i in range(0, len(pattern), 4))
+    return (pattern * (size // len(pattern) + 1))[:size]
+
+
+def make_write(writer: DataWriter, msg: IdlStruct):
+    """Return a zero-argument callable that publishes msg.
+
+    The sample is serialized to CDR once and the same buffer is handed to the
+    C layer on every call. Falls back to writer.write(msg) if the private
+    serialized-write entrypoint is unavailable. The callable returns a
+    non-zero DDS return code on failure.
+    """
+    try:
+        from cyclonedds._clayer import ddspy_write
+        ser = msg.serialize(use_version_2=writer._use_version_2)
+    except (ImportError, AttributeError, TypeError):
+        return functools.partial(writer.write, msg)
+    # Pad to a multiple of 4 bytes, as DataWriter.write does
+    ser = ser.ljust((len(ser) + 3) & ~3, b"\0")
+    return functools.partial(ddspy_write, writer._ref, ser)
+
+
+def write_n(write, n: int) -> int:
+    """Call write() n times, stopping at the first non-zero return code.
+
+    The loop is driven from C by itertools, so no bytecode runs per message.
+    Returns the failing return code, or 0 if every write succeeded.
+    """
+    return next(filter(None, starmap(write, repeat((), n))), 0)
 
 
-@dataclass
-class BenchmarkData(IdlStruct):
-    """DDS message type for benchmarking with variable-size byte payload."""
-    data: sequence[uint8]
+def wait_for_subscribers(participant: DomainParticipant, writer: DataWriter, count: int, timeout: float) -> int:
+    """Block until the writer has matched count subscribers or timeout seconds pass.
 
+    Once matched, waits a further DISCOVERY_SETTLE_TIME for the subscribers to
+    match the writer in turn. Returns the number of matched subscribers.
+    """
+    writer.set_status_mask(DDSStatus.PublicationMatched)
+    waitset = WaitSet(participant)
+    waitset.attach(writer)
+    deadline = time.perf_counter() + timeout
+    while (matched := len(writer.get_matched_subscriptions())) < count:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        waitset.wait(duration(seconds=remaining))
+        writer.take_status(DDSStatus.PublicationMatched)
+    waitset.detach(writer)
+    if matched:
+        time.sleep(DISCOVERY_SETTLE_TIME)
+    return matched
 
-def make_data_bytes(size: int) -> bytes:
-    """Generate bytes of given size."""
-    return bytes(i % 256 for i in range(size))
+
+def set_write_batching(enable: bool) -> None:
+    """Enable or disable write batching for all domains in this process.
+
+    With batching enabled, CycloneDDS packs consecutive samples into as few
+    datagrams as possible and only sends them once the packet is full or the
+    writer is flushed with flush_writer().
+    """
+    load_cyclonedds().dds_write_set_batch(enable)
+
+
+def flush_writer(writer: DataWriter) -> None:
+    """Send any samples still held back by write batching."""
+    ret = load_cyclonedds().dds_write_flush(writer._ref)
+    if ret < 0:
+        raise DDSException(ret, f"Occurred while flushing {repr(writer)}")
 
 
 def main():
@@ -35,10 +122,25 @@ def main():
     parser.add_argument("--topic", type=str, default="benchmark/dds", help="Topic name")
     parser.add_argument("--domain", type=int, default=0, help="DDS domain ID")
     parser.add_argument("--qos", type=str, default="reliable", choices=["reliable", "high-throughput", "best-effort"],
-                        help="QoS preset: reliable (guaranteed delivery), high-throughput (optimized for speed), best-effort (minimal overhead)")
+                        help="QoS preset: reliable (guaranteed delivery), high-throughput (optimized for speed), best-effort (minimal overhead); "
+                             "high-throughput and best-effort set a 1 ms latency budget, trading a little latency for throughput")
     parser.add_argument("--rate", type=float, default=0, help="Target publish rate in msg/s (0 = unlimited)")
+    parser.add_argument("--subscribers", type=int, default=1,
+                        help="Number of subscribers to wait for before publishing (0 = start immediately)")
+    parser.add_argument("--discovery-timeout", type=float, default=10.0,
+                        help="Maximum time in seconds to wait for subscribers")
+    parser.add_argument("--batch", action="store_true",
+                        help="Coalesce samples into fewer datagrams (best-effort and high-throughput presets only)")
+    add_common_arguments(parser, peer="subscriber", loop="publish")
     args = parser.parse_args()
 
+    if args.batch and args.qos == "reliable":
+        parser.error("--batch is only supported with the high-throughput and best-effort presets")
+
+    check_common_arguments(parser, args)
+
+    apply_common_arguments(args)
+
     # Create QoS based on preset
     if args.qos == "reliable":
         qos = Qos(
@@ -52,6 +154,7 @@ def main():
             Policy.Reliability.BestEffort,
             Policy.History.KeepLast(1000),  # Larger buffer to reduce loss
             Policy.Durability.Volatile,
+            Policy.LatencyBudget(budget=1_000_000),  # 1 ms: lets writes be sent asynchronously
         )
         print("Using HIGH-THROUGHPUT QoS (best-effort, larger buffer)")
     else:  # best-effort
@@ -59,48 +162,85 @@ def main():
             Policy.Reliability.BestEffort,
             Policy.History.KeepLast(100),
             Policy.Durability.Volatile,
+            Policy.LatencyBudget(budget=1_000_000),  # 1 ms: lets writes be sent asynchronously
         )
         print("Using BEST-EFFORT QoS (no guarantees, moderate buffering)")
 
+    data_type = make_fixed_size_type(args.size) if args.fixed_size else BenchmarkData
+
     # Create DDS entities
     participant = DomainParticipant(domain_id=args.domain)
-    topic = Topic(participant, args.topic, BenchmarkData, qos=qos)
+    topic = Topic(participant, args.topic, data_type, qos=qos)
     publisher = Publisher(participant)
     writer = DataWriter(publisher, topic, qos=qos)
 
+    # Pin after the DDS entities exist so CycloneDDS's own threads stay unpinned
+    if args.cpu:
+        pin_to_cpus(args.cpu)
+
+    if args.batch:
+        set_write_batching(True)
+        print("Write batching enabled")
+
     # Generate message
-    msg = BenchmarkData(data=make_data_bytes(args.size))
+    msg = data_type(data=make_payload(args.size, args.dtype))
+    write = make_write(writer, msg)
 
     print(f"Topic: {args.topic}")
+    print(f"Type: {data_type.__idl_typename__}")
     print(f"Domain: {args.domain}")
-    print(f"Message size: {args.size} bytes")
+    print(f"Message size: {args.size} bytes ({args.size // DTYPE_SIZES[args.dtype]} {args.dtype} elements)")
     print(f"Message count: {args.count}")
-    print("Waiting 2 seconds for subscriber to connect...")
-    time.sleep(2)
+    if args.subscribers > 0:
+        print(f"Waiting for {args.subscribers} subscriber(s) to connect...")
+        matched = wait_for_subscribers(participant, writer, args.subscribers, args.discovery_timeout)
+        if matched < args.subscribers:
+            print(f"Warning: only {matched}/{args.subscribers} subscriber(s) matched "
+                  f"after {args.discovery_timeout} seconds, publishing anyway")
 
     print("Starting publish...")
     if args.rate > 0:
         target_mbps = (args.rate * args.size) / (1024 * 1024)
         print(f"Target rate: {args.rate} msg/s ({target_mbps:.2f} MB/s)")
-        interval = 1.0 / args.rate
+        # At least 1 ns: rates above ~2e9 msg/s would round to 0 and silently disable pacing
+        interval_ns = max(1, round(1e9 / args.rate))
     else:
         print("Rate: unlimited")
-        interval = 0
+        interval_ns = 0
+
+    start_ns = time.perf_counter_ns()
+    deadline_ns = start_ns
 
-    start_time = time.perf_counter()
+    if interval_ns > 0:
+        # When messages are due faster than a wait can resolve, send them in
+        # bursts that span about SPIN_THRESHOLD_NS and wait between bursts
+        burst = min(WRITE_CHUNK, max(1, SPIN_THRESHOLD_NS // interval_ns))
+        # Bind hot-loop callables to locals to skip attribute lookups per message
+        perf_counter_ns = time.perf_counter_ns
+        sleep = time.sleep
+        for sent in range(0, args.count, burst):
+            n = min(burst, args.count - sent)
+            ret = write_n(write, n)
+            if ret:
+                raise DDSException(ret, f"Occurred while writing sample in {repr(writer)}")
+            # Wait for the next send slot on a fixed schedule so delays don't accumulate
+            deadline_ns += n * interval_ns
+            remaining_ns = deadline_ns - perf_counter_ns()
+            if remaining_ns > SPIN_THRESHOLD_NS:
+                sleep(remaining_ns / 1e9)
+            else:
+                while perf_counter_ns() < deadline_ns:
+                    pass
+    else:
+        ret = write_n(write, args.count)
+        if ret:
+            raise DDSException(ret, f"Occurred while writing sample in {repr(writer)}")
 
-    for i in range(args.count):
-        writer.write(msg)
-        if interval > 0:
-            # Sleep to maintain target rate
-            elapsed = time.perf_counter() - start_time
-            expected = (i + 1) * interval
-            sleep_time = expected - elapsed
-            if sleep_time > 0:
-                time.sleep(sleep_time)
+    if args.batch:
+        flush_writer(writer)
 
-    end_time = time.perf_counter()
-    elapsed = end_time - start_time
+    end_ns = time.perf_counter_ns()
+    elapsed = (end_ns - start_ns) / 1e9
 
     # Calculate throughput
     total_bytes = args.size * args.count
@@ -114,6 +254,7 @@ def main():
     print(f"Throughput: {throughput_msgs:.2f} msg/s")
     print(f"Throughput: {throughput_mbps:.2f} MB/s")
     print(f"Throughput: {throughput_mbps * 8:.2f} Mbps")
+    print(f"Throughput: {throughput_bytes / DTYPE_SIZES[args.dtype]:.2f} {args.dtype} elements/s")
 
     # Keep alive briefly for reliable delivery
     if args.qos == "reliable":
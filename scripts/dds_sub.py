@@ -2,25 +2,81 @@
 """Simple CycloneDDS subscriber with throughput measurement."""
 
 import argparse
+import gc
 import os
+import socket
+import stat
+import sys
+import threading
 import time
 
 # Use minimal CycloneDDS config to avoid buffer size issues
 os.environ["CYCLONEDDS_URI"] = ""
 
-from cyclonedds.core import Qos, Policy
+# Linux socket option number; not exported by the socket module
+SO_BUSY_POLL = getattr(socket, "SO_BUSY_POLL", 46)
+
+from cyclonedds.core import InstanceState, Qos, Policy, ReadCondition, SampleState, ViewState, WaitSet
 from cyclonedds.domain import DomainParticipant
 from cyclonedds.sub import DataReader, Subscriber
 from cyclonedds.topic import Topic
-from cyclonedds.idl import IdlStruct
-from cyclonedds.idl.types import sequence, uint8
+from cyclonedds.util import duration
 from dataclasses import dataclass
 
+from dds_common import (
+    DTYPE_SIZES, BenchmarkData, add_common_arguments, apply_common_arguments, check_common_arguments,
+    limit_history_for_shm, make_fixed_size_type, pin_to_cpus,
+)
+
 
 @dataclass
-class BenchmarkData(IdlStruct):
-    """DDS message type for benchmarking with variable-size byte payload."""
-    data: sequence[uint8]
+class ReceiveProgress:
+    """Received-message counter shared between the receive loop and the progress reporter.
+
+    Only the receive loop writes it, once per batch, so no lock is needed.
+    """
+    received_count: int = 0
+
+
+def report_progress(progress: ReceiveProgress, expected: int, stop: threading.Event,
+                    period: float = 0.1, step: int = 100) -> None:
+    """Print receive progress to stderr, at most every period seconds and every step messages, until stop is set."""
+    # Write preformatted lines straight to the stderr file descriptor, bypassing print()
+    stderr_fd = sys.stderr.fileno()
+    template = f"Received %d/{expected} messages...\n"
+    next_print = step
+    while not stop.wait(period):
+        count = progress.received_count
+        if count >= next_print:
+            os.write(stderr_fd, (template % count).encode())
+            next_print = count - count % step + step
+
+
+def enable_busy_poll(usecs: int) -> int:
+    """Set SO_BUSY_POLL on every UDP socket open in this process.
+
+    CycloneDDS has no configuration option for busy polling, so this walks
+    /proc/self/fd after the DDS entities are created and sets the option on
+    the sockets it finds. Returns the number of sockets configured.
+    """
+    configured = 0
+    for name in os.listdir("/proc/self/fd"):
+        fd = int(name)
+        try:
+            if not stat.S_ISSOCK(os.fstat(fd).st_mode):
+                continue
+            sock = socket.socket(fileno=fd)
+        except OSError:
+            continue
+        try:
+            if sock.family in (socket.AF_INET, socket.AF_INET6) and sock.type == socket.SOCK_DGRAM:
+                sock.setsockopt(socket.SOL_SOCKET, SO_BUSY_POLL, usecs)
+                configured += 1
+        except OSError as e:
+            print(f"Warning: could not set SO_BUSY_POLL on fd {fd}: {e}")
+        finally:
+            sock.detach()
+    return configured
 
 
 def main():
@@ -30,10 +86,19 @@ def main():
     parser.add_argument("--topic", type=str, default="benchmark/dds", help="Topic name")
     parser.add_argument("--domain", type=int, default=0, help="DDS domain ID")
     parser.add_argument("--qos", type=str, default="reliable", choices=["reliable", "high-throughput", "best-effort"],
-                        help="QoS preset: reliable (guaranteed delivery), high-throughput (optimized for speed), best-effort (minimal overhead)")
+                        help="QoS preset: reliable (guaranteed delivery), high-throughput (optimized for speed), best-effort (minimal overhead); "
+                             "high-throughput and best-effort set a 1 ms latency budget, trading a little latency for throughput")
     parser.add_argument("--timeout", type=float, default=30.0, help="Timeout in seconds")
+    parser.add_argument("--busy-poll", type=int, default=0, metavar="USECS",
+                        help="Busy-poll the DDS UDP sockets for up to USECS microseconds per receive (SO_BUSY_POLL); "
+                             "requires CAP_NET_ADMIN, or net.core.busy_read set to at least USECS")
+    add_common_arguments(parser, peer="publisher", loop="receive")
     args = parser.parse_args()
 
+    check_common_arguments(parser, args)
+
+    apply_common_arguments(args)
+
     # Create QoS based on preset
     if args.qos == "reliable":
         qos = Qos(
@@ -47,6 +112,7 @@ def main():
             Policy.Reliability.BestEffort,
             Policy.History.KeepLast(1000),  # Larger buffer to reduce loss
             Policy.Durability.Volatile,
+            Policy.LatencyBudget(budget=1_000_000),  # 1 ms: lets writes be sent asynchronously
         )
         print("Using HIGH-THROUGHPUT QoS (best-effort, larger buffer)")
     else:  # best-effort
@@ -54,18 +120,34 @@ def main():
             Policy.Reliability.BestEffort,
             Policy.History.KeepLast(100),
             Policy.Durability.Volatile,
+            Policy.LatencyBudget(budget=1_000_000),  # 1 ms: lets writes be sent asynchronously
         )
         print("Using BEST-EFFORT QoS (no guarantees, moderate buffering)")
 
+    if args.shm:
+        qos = limit_history_for_shm(qos)
+
+    data_type = make_fixed_size_type(args.size) if args.fixed_size else BenchmarkData
+
     # Create DDS entities
     participant = DomainParticipant(domain_id=args.domain)
-    topic = Topic(participant, args.topic, BenchmarkData, qos=qos)
+    topic = Topic(participant, args.topic, data_type, qos=qos)
     subscriber = Subscriber(participant)
     reader = DataReader(subscriber, topic, qos=qos)
 
+    if args.busy_poll > 0:
+        configured = enable_busy_poll(args.busy_poll)
+        print(f"SO_BUSY_POLL={args.busy_poll}us set on {configured} UDP sockets")
+
+    # Block in the DDS layer until data arrives instead of polling
+    condition = ReadCondition(reader, SampleState.Any | ViewState.Any | InstanceState.Any)
+    waitset = WaitSet(participant)
+    waitset.attach(condition)
+
     print(f"Topic: {args.topic}")
+    print(f"Type: {data_type.__idl_typename__}")
     print(f"Domain: {args.domain}")
-    print(f"Expected message size: {args.size} bytes")
+    print(f"Expected message size: {args.size} bytes ({args.size // DTYPE_SIZES[args.dtype]} {args.dtype} elements)")
     print(f"Expected message count: {args.count}")
     print("Waiting for messages...")
 
@@ -74,38 +156,56 @@ def main():
     first_msg_time = None
     last_msg_time = None
 
+    # Report progress from a separate thread so printing stays off the receive path
+    progress = ReceiveProgress()
+    stop_reporting = threading.Event()
+    reporter = threading.Thread(target=report_progress, args=(progress, args.count, stop_reporting), daemon=True)
+    reporter.start()
+
+    # Pin after the DDS entities and the reporter thread exist so neither
+    # CycloneDDS's own threads nor progress reporting share the receive CPUs
+    if args.cpu:
+        pin_to_cpus(args.cpu)
+
+    # Every take() allocates a fresh list and sample objects; they hold no
+    # reference cycles, so pause the cyclic GC to keep its passes out of the window
+    gc.disable()
+
     start_wait = time.perf_counter()
 
     while received_count < args.count:
         # Check timeout
-        if time.perf_counter() - start_wait > args.timeout:
+        remaining = args.timeout - (time.perf_counter() - start_wait)
+        if remaining <= 0:
             print(f"Timeout reached after {args.timeout} seconds")
             break
 
-        # Try to read messages (large batch for throughput)
-        samples = reader.take(1000)
-
-        if samples:
-            now = time.perf_counter()
+        if waitset.wait(duration(seconds=remaining)) == 0:
+            continue
 
-            for sample in samples:
-                # Skip invalid samples (disposed/unregistered instances)
-                if not isinstance(sample, BenchmarkData):
-                    continue
+        # Take available messages (large batch for throughput)
+        samples = reader.take(1000, condition=condition)
 
-                if first_msg_time is None:
-                    first_msg_time = now
-                last_msg_time = now
+        # Skip invalid samples (disposed/unregistered instances) and keep only the payloads
+        payloads = [sample.data for sample in samples if type(sample) is data_type]
+        if not payloads:
+            continue
 
-                received_count += 1
-                total_bytes += len(sample.data)
+        now = time.perf_counter()
+        if first_msg_time is None:
+            first_msg_time = now
+        last_msg_time = now
 
-                # Print progress every 100 messages
-                if received_count % 100 == 0:
-                    print(f"Received {received_count}/{args.count} messages...")
+        received_count += len(payloads)
+        if args.fixed_size:
+            total_bytes += args.size * len(payloads)
         else:
-            # Small sleep to avoid busy waiting
-            time.sleep(0.001)
+            total_bytes += sum(map(len, payloads))
+        progress.received_count = received_count
+
+    gc.enable()
+    stop_reporting.set()
+    reporter.join()
 
     # Calculate throughput
     if first_msg_time and last_msg_time and received_count > 1:
@@ -116,10 +216,12 @@ def main():
             throughput_mbps = throughput_bytes / (1024 * 1024)
         else:
             throughput_msgs = float('inf')
+            throughput_bytes = float('inf')
             throughput_mbps = float('inf')
     else:
         elapsed = 0
         throughput_msgs = 0
+        throughput_bytes = 0
         throughput_mbps = 0
 
     print(f"\n--- Subscriber Results ---")
@@ -129,6 +231,7 @@ def main():
     print(f"Throughput: {throughput_msgs:.2f} msg/s")
     print(f"Throughput: {throughput_mbps:.2f} MB/s")
     print(f"Throughput: {throughput_mbps * 8:.2f} Mbps")
+    print(f"Throughput: {throughput_bytes / DTYPE_SIZES[args.dtype]:.2f} {args.dtype} elements/s")
 
     if received_count < args.count:
         loss_rate = (args.count - received_count) / args.count * 100